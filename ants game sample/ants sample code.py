@@ -1,6 +1,9 @@
+import multiprocessing
 import random
 from ucb import main, interact, trace
+from bisect import bisect_left, bisect_right
 from collections import OrderedDict
+from math import sqrt
 
 ################
 # Core Classes #
@@ -9,6 +12,7 @@ from collections import OrderedDict
 
 class Place:
     """A Place holds insects and has an exit to another Place."""
+    __slots__ = ('name', 'exit', '_bees', 'ant', 'entrance', 'tunnel', 'depth')
     is_hive = False
 
     def __init__(self, name, exit=None):
@@ -19,25 +23,153 @@ class Place:
         """
         self.name = name
         self.exit = exit
-        self.bees = []        # A list of Bees
+        self._bees = None     # A list of Bees, allocated when first used
         self.ant = None       # An Ant
         self.entrance = None  # A Place
         if self.exit:
+            tunnel = self.exit.tunnel
+            if self.exit.depth + 1 < len(tunnel.places):
+                tunnel.split(self.exit.depth)  # The exit gets a new entrance
+            tunnel.append(self)
             self.exit.entrance = self
+        else:
+            Tunnel().append(self)
 
     def add_insect(self, insect):
-        ...
+        """Asks the insect to add itself to this place. This method exists so
+        that it can be overridden in subclasses.
+        """
+        insect.add_to(self)
+        if not self.is_hive:
+            self.tunnel.update(self)
 
     def remove_insect(self, insect):
-        ...
+        """Asks the insect to remove itself from this place. This method exists so
+        that it can be overridden in subclasses.
+        """
+        insect.remove_from(self)
+        if not self.is_hive:
+            self.tunnel.update(self)
+
+    @property
+    def bees(self):
+        """The list of Bees in this Place."""
+        if self._bees is None:
+            self._bees = []
+        return self._bees
+
+    @bees.setter
+    def bees(self, bees):
+        self._bees = bees
+
+    @property
+    def has_bees(self):
+        """Whether there are Bees in this Place, without allocating a list."""
+        return bool(self._bees)
+
+    def reduce_bees_health(self, amount):
+        """Reduce the health of every Bee in this Place by AMOUNT, in order, as
+        if reduce_health were called on each. Bees that die have their death
+        callbacks called in order and are removed together in one pass over
+        the list, rather than one at a time. Bees whose class overrides
+        reduce_health have it called instead.
+        """
+        if not self.has_bees:
+            return
+        dead = []
+        for bee in self.bees[:]:
+            if type(bee).reduce_health is not Insect.reduce_health:
+                bee.reduce_health(amount)
+                continue
+            bee.health -= amount
+            if bee.health <= 0:
+                bee.death_callback()
+                dead.append(bee)
+        if dead:
+            dead_ids = {id(bee) for bee in dead}
+            self.bees[:] = [bee for bee in self.bees if id(bee) not in dead_ids]
+            for bee in dead:
+                Insect.remove_from(bee, self)
+            if not self.is_hive:
+                self.tunnel.update(self)
 
     def __str__(self):
        ...
 
 
+class Tunnel:
+    """The Places reached from a first Place by following entrances, in order.
+    Each Place knows its tunnel and its depth, its index in the tunnel. The
+    depths of the Places that hold bees are kept sorted, so that the nearest
+    bee in a range of depths can be found by bisection.
+    """
+
+    def __init__(self):
+        self.places = []
+        self.occupied = []  # Sorted depths of the Places with bees
+
+    def append(self, place):
+        place.tunnel, place.depth = self, len(self.places)
+        self.places.append(place)
+
+    def split(self, depth):
+        """Move the Places deeper than DEPTH into a new Tunnel and return it."""
+        rest = Tunnel()
+        for place in self.places[depth + 1:]:
+            rest.append(place)
+        del self.places[depth + 1:]
+        k = bisect_right(self.occupied, depth)
+        rest.occupied = [d - depth - 1 for d in self.occupied[k:]]
+        del self.occupied[k:]
+        return rest
+
+    def update(self, place):
+        """Record whether PLACE, a Place in this tunnel, holds any bees."""
+        k = bisect_left(self.occupied, place.depth)
+        recorded = k < len(self.occupied) and self.occupied[k] == place.depth
+        if place.has_bees and not recorded:
+            self.occupied.insert(k, place.depth)
+        elif not place.has_bees and recorded:
+            del self.occupied[k]
+
+    def nearest_occupied(self, depth, lower_bound, upper_bound):
+        """Return the Place with bees nearest to DEPTH among those at least
+        LOWER_BOUND and at most UPPER_BOUND places deeper, or None. Like
+        ThrowerAnt.nearest_bee, a Place without an entrance is never chosen.
+
+        >>> places = [Place('tunnel_0')]
+        >>> for i in range(1, 6):
+        ...     places.append(Place('tunnel_' + str(i), places[-1]))
+        >>> tunnel = places[0].tunnel
+        >>> for i in [1, 3, 5]:
+        ...     places[i].bees.append('bee')
+        ...     tunnel.update(places[i])
+        >>> tunnel.occupied
+        [1, 3, 5]
+        >>> tunnel.nearest_occupied(0, -1, float('inf')).name
+        'tunnel_1'
+        >>> tunnel.nearest_occupied(0, 2, float('inf')).name
+        'tunnel_3'
+        >>> print(tunnel.nearest_occupied(0, 4, float('inf')))  # No entrance
+        None
+        >>> print(tunnel.nearest_occupied(2, -1, 0))
+        None
+        >>> rest = tunnel.split(2)
+        >>> tunnel.occupied, rest.occupied, places[4].depth
+        ([1], [0, 2], 1)
+        """
+        k = bisect_left(self.occupied, depth + max(lower_bound, 0))
+        if k == len(self.occupied) or self.occupied[k] - depth > upper_bound:
+            return None
+        place = self.places[self.occupied[k]]
+        if place.entrance:
+            return place
+
+
 class Insect:
     """An Insect, the base class of Ant and Bee, has health and a Place."""
 
+    __slots__ = ('health', 'place')
     damage = 0
     is_waterproof = False
 
@@ -80,7 +212,11 @@ class Insect:
 
 
 class Ant(Insect):
-    """An Ant occupies a place and does work for the colony."""
+    """An Ant occupies a place and does work for the colony.
+
+    Ants keep a __dict__, unlike other Insects, since double and QueenAnt
+    set damage and doubled on each Ant.
+    """
 
     implemented = False
     food_cost = 0
@@ -162,6 +298,15 @@ class ThrowerAnt(Ant):
 
         This method returns None if there is no such Bee (or none in range).
         """
+        place = self.place.tunnel.nearest_occupied(
+            self.place.depth, self.lower_bound, self.upper_bound)
+        if place is not None:
+            return random_bee(place.bees)
+
+    def walk_nearest_bee(self):
+        """Return the same Bee as nearest_bee, by following entrances one Place
+        at a time rather than using the tunnel's index.
+        """
         i = 0
         iter_place = self.place
         while iter_place.entrance:
@@ -187,6 +332,78 @@ def random_bee(bees):
     if bees:
         return random.choice(bees)
 
+
+def nearest_bee_benchmark(length=1000, throwers=100, bees=10, number=10):
+    """Time nearest_bee and walk_nearest_bee for THROWERS ThrowerAnts near the
+    start of a tunnel LENGTH Places long, with BEES Bees spread over its far half.
+    """
+    from timeit import timeit
+    places = [Place('tunnel_0')]
+    for i in range(1, length + 1):
+        places.append(Place('tunnel_' + str(i), places[-1]))
+    ants = []
+    for place in places[:throwers]:
+        ant = ThrowerAnt()
+        place.add_insect(ant)
+        ants.append(ant)
+    for i in range(bees):
+        places[length // 2 + i * (length // 2) // bees].add_insect(Bee(3))
+    for method in [ThrowerAnt.nearest_bee, ThrowerAnt.walk_nearest_bee]:
+        elapsed = timeit(lambda: [method(ant) for ant in ants], number=number)
+        print('{}({} places, {} throwers): {:.2f}ms per turn'.format(
+            method.__name__, length, throwers, elapsed / number * 1000))
+
+
+def memory_benchmark(num_insects=100000, length=100):
+    """Print the memory used per Place, per Bee and per Ant on a board of
+    NUM_INSECTS Places in tunnels LENGTH Places long, with a Bee and an Ant
+    for each Place.
+    """
+    import tracemalloc
+    tracemalloc.start()
+    board = []
+
+    def measure(name, make):
+        before = tracemalloc.get_traced_memory()[0]
+        board.append([make(i) for i in range(num_insects)])
+        used = tracemalloc.get_traced_memory()[0] - before
+        print('{}: {:.1f} bytes each'.format(name, used / num_insects))
+
+    places = []
+
+    def make_place(i):
+        exit = places[-1] if i % length else None
+        places.append(Place('place_' + str(i), exit))
+        return places[-1]
+    measure('Place', make_place)
+    measure('Bee', lambda i: Bee(3, places[i]))
+    measure('Ant', lambda i: ThrowerAnt())
+    tracemalloc.stop()
+
+
+def swarm_benchmark(bees=500, number=20):
+    """Time Place.reduce_bees_health against calling reduce_health on each of
+    BEES Bees in one Place, half of which die.
+    """
+    from time import perf_counter
+
+    def reduce_each(place, amount):
+        for bee in place.bees[:]:
+            bee.reduce_health(amount)
+
+    for name, reduce in [('reduce_bees_health', Place.reduce_bees_health),
+                         ('reduce_health per bee', reduce_each)]:
+        elapsed = 0
+        for _ in range(number):
+            place = Place('swarm', Place('exit'))
+            for i in range(bees):
+                place.add_insect(Bee(1 + i % 2))
+            start = perf_counter()
+            reduce(place, 1)
+            elapsed += perf_counter() - start
+        print('{}({} bees): {:.3f}ms'.format(name, bees, elapsed / number * 1000))
+
+
 ##############
 # Extensions #
 ##############
@@ -227,14 +444,10 @@ class FireAnt(Ant):
         Make sure to reduce the health of each bee in the current place, and apply
         the additional damage if the fire ant dies.
         """
-        for b in list(self.place.bees):
-            b.reduce_health(amount)
+        self.place.reduce_bees_health(amount)
         if amount >= self.health:
-            for i in list(self.place.bees):
-                i.reduce_health(self.damage)
-            super().reduce_health(amount)
-        else:
-            super().reduce_health(amount)
+            self.place.reduce_bees_health(self.damage)
+        super().reduce_health(amount)
 
 class WallAnt(Ant):
 
@@ -322,12 +535,12 @@ class TankAnt(ContainerAnt):
     def action(self, gamestate):
         if self.ant_contained is not None:
             self.ant_contained.action(gamestate)
-        for b in self.place.bees[:]:
-            b.reduce_health(self.damage)
+        self.place.reduce_bees_health(self.damage)
 
 
 class Water(Place):
     """Water is a place that can only hold waterproof insects."""
+    __slots__ = ()
 
     def add_insect(self, insect):
         """Add an Insect to this place. If the insect is not waterproof, reduce
@@ -404,13 +617,18 @@ class AntRemover(Ant):
 class Bee(Insect):
     """A Bee moves from place to place, following exits and stinging ants."""
 
+    __slots__ = ('is_slowed', 'is_scared', 'slowed_turns', 'scared_turns')
     name = 'Bee'
     damage = 1
-    is_slowed = False
-    is_scared = False
-    slowed_turns = 0
-    scared_turns = 0
     is_waterproof = True
+
+    def __init__(self, health, place=None):
+        super().__init__(health, place)
+        self.is_slowed = False
+        self.is_scared = False
+        self.slowed_turns = 0
+        self.scared_turns = 0
+
     ...
 
     def blocked(self):
@@ -473,3 +691,205 @@ class NinjaAnt(Ant):
 # Statuses #
 ############
 ...
+
+
+#######################
+# Headless Simulation #
+#######################
+
+
+def deploy_if_affordable(gamestate, place_name, ant_type_name):
+    """Deploy an ant like GameState.deploy_ant, but skip it without printing if
+    the colony cannot afford it. Returns the deployed ant or None."""
+    if gamestate.ant_types[ant_type_name].food_cost <= gamestate.food:
+        return gamestate.deploy_ant(place_name, ant_type_name)
+
+
+def simulate_headless(gamestate, deployments):
+    """Play GAMESTATE to the end exactly as GameState.simulate does, without
+    printing, and return whether the ants won and the number of turns played.
+
+    deployments -- A dictionary from a time to a list of (place name, ant type
+                   name) pairs to deploy, in order, at the start of that turn.
+    """
+    num_bees = len(gamestate.bees)
+    try:
+        while True:
+            gamestate.beehive.strategy(gamestate)
+            for place_name, ant_type_name in deployments.get(gamestate.time, ()):
+                deploy_if_affordable(gamestate, place_name, ant_type_name)
+            for ant in gamestate.ants:
+                if ant.health > 0:
+                    ant.action(gamestate)
+            for bee in gamestate.active_bees[:]:
+                if bee.health > 0:
+                    bee.action(gamestate)
+                if bee.health <= 0:
+                    num_bees -= 1
+                    gamestate.active_bees.remove(bee)
+            if num_bees == 0:
+                raise AntsWinException()
+            gamestate.time += 1
+    except AntsWinException:
+        return True, gamestate.time
+    except AntsLoseException:
+        return False, gamestate.time
+
+
+def play_headless(make_assault_plan, deployments, create_places=None,
+                  dimensions=(3, 9), food=2):
+    """Play one game against the AssaultPlan returned by MAKE_ASSAULT_PLAN,
+    deploying ants according to DEPLOYMENTS on the layout made by
+    CREATE_PLACES (dry_layout by default), and return whether the ants won and
+    the number of turns played.
+
+    Its speed, meant to be tens of thousands of games per minute, has not been
+    measured: GameState, Hive and the layouts are elided from this file.
+    """
+    if create_places is None:
+        create_places = dry_layout
+    beehive = Hive(make_assault_plan())
+    gamestate = GameState(beehive, ant_types(), create_places, dimensions, food)
+    return simulate_headless(gamestate, deployments)
+
+
+def play_headless_games(num_games, make_assault_plan, deployments, seed=None,
+                        **options):
+    """Play NUM_GAMES headless games and return a list of (won, turns) pairs.
+    If SEED is given, random is seeded with SEED + i before game i, so that
+    the bees each thrower targets are the same from run to run.
+
+    options -- Passed on to play_headless.
+    """
+    results = []
+    for i in range(num_games):
+        if seed is not None:
+            random.seed(seed + i)
+        results.append(play_headless(make_assault_plan, deployments, **options))
+    return results
+
+
+def balance_sweep(configurations, make_assault_plan, deployments, games=1000,
+                  processes=None, seed=0, chunk_size=100, **options):
+    """Play GAMES headless games for each configuration in CONFIGURATIONS in a
+    process pool, and return a list of (configuration, wins, low, high) tuples
+    in the same order, where LOW and HIGH bound the 95% confidence interval of
+    the win rate.
+
+    Each configuration is a dictionary from the names of ant classes to
+    dictionaries of the class attributes to set while its games are played,
+    such as {'TankAnt': {'food_cost': 5, 'health': 3}}. The 'health' entry
+    sets the health of ants of exactly that class that are created without
+    one, such as by Ant.construct. Game i of every
+    configuration is seeded with SEED + i, so configurations are compared on
+    the same choices of random_bee where their games agree.
+
+    options -- Passed on to play_headless.
+    """
+    tasks = [(index, configuration, make_assault_plan, deployments,
+              seed + start, min(chunk_size, games - start), options)
+             for index, configuration in enumerate(configurations)
+             for start in range(0, games, chunk_size)]
+    wins = [0] * len(configurations)
+    with multiprocessing.Pool(processes) as pool:
+        for index, won in pool.imap_unordered(_play_configuration, tasks):
+            wins[index] += won
+    return [(configuration, won) + wilson_interval(won, games)
+            for configuration, won in zip(configurations, wins)]
+
+
+def _play_configuration(task):
+    """Return (index, games won) for one chunk of games of balance_sweep."""
+    index, configuration, make_assault_plan, deployments, seed, num_games, options = task
+    previous = configure_ants(configuration)
+    try:
+        results = play_headless_games(num_games, make_assault_plan, deployments,
+                                      seed, **options)
+    finally:
+        restore_ants(previous)
+    return index, sum(won for won, _ in results)
+
+
+def configure_ants(configuration):
+    """Set the class attributes in CONFIGURATION, as described in
+    balance_sweep, and return what is needed to restore them.
+
+    >>> previous = configure_ants({'TankAnt': {'food_cost': 5, 'health': 3}})
+    >>> TankAnt.food_cost, TankAnt().health
+    (5, 3)
+    >>> restore_ants(previous)
+    >>> TankAnt.food_cost, TankAnt().health
+    (6, 2)
+    >>> previous = configure_ants({'ThrowerAnt': {'health': 2}})
+    >>> ThrowerAnt().health, ShortThrower().health, ThrowerAnt(5).health
+    (2, 1, 5)
+    >>> restore_ants(previous)
+    >>> ThrowerAnt().health, '__init__' in vars(ThrowerAnt)
+    (1, False)
+    """
+    previous = []
+    for class_name, attributes in configuration.items():
+        cls = globals()[class_name]
+        for name, value in attributes.items():
+            if name == 'health':
+                name, value = '__init__', _with_default_health(cls, value)
+            previous.append((cls, name, vars(cls).get(name, _INHERITED)))
+            setattr(cls, name, value)
+    return previous
+
+
+def _with_default_health(cls, health):
+    """Return an __init__ for CLS that gives ants of exactly class CLS the
+    given HEALTH when they are created without one, and otherwise calls the
+    __init__ that CLS has now.
+    """
+    original_init = cls.__init__
+
+    def __init__(self, *args, **kwargs):
+        if type(self) is cls and not args and 'health' not in kwargs:
+            kwargs['health'] = health
+        original_init(self, *args, **kwargs)
+    return __init__
+
+
+_INHERITED = object()  # Marks a class attribute that was not set on the class
+
+
+def restore_ants(previous):
+    """Undo configure_ants, given the list it returned."""
+    for owner, name, value in reversed(previous):
+        if value is _INHERITED:
+            delattr(owner, name)
+        else:
+            setattr(owner, name, value)
+
+
+def wilson_interval(wins, games, z=1.96):
+    """Return the Wilson score interval for a win rate of WINS out of GAMES, at
+    the confidence level for which Z is the normal quantile.
+
+    >>> low, high = wilson_interval(80, 100)
+    >>> round(low, 3), round(high, 3)
+    (0.711, 0.867)
+    >>> wilson_interval(0, 0)
+    (0.0, 1.0)
+    """
+    if games == 0:
+        return 0.0, 1.0
+    rate = wins / games
+    scale = 1 + z * z / games
+    center = (rate + z * z / (2 * games)) / scale
+    half_width = z * sqrt(rate * (1 - rate) / games + z * z / (4 * games * games)) / scale
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+def print_balance_table(results, games):
+    """Print the results of balance_sweep for GAMES games per configuration."""
+    print('{:<50} {:>8}  {}'.format('Configuration', 'Win rate', '95% interval'))
+    for configuration, won, low, high in results:
+        description = '; '.join(
+            '{} {}'.format(class_name, ', '.join(
+                '{}={}'.format(name, value) for name, value in attributes.items()))
+            for class_name, attributes in configuration.items()) or 'default'
+        print('{:<50} {:>8.3f}  [{:.3f}, {:.3f}]'.format(
+            description, won / games, low, high))
@@ -3,7 +3,17 @@
 from lib2to3.pytree import type_repr
 from utils import lower, split, remove_punctuation, lines_from_file
 from ucb import main, interact, trace
+from bisect import bisect_left
+from collections import OrderedDict
+from heapq import merge, nlargest
 from datetime import datetime
+from time import perf_counter
+import asyncio
+import multiprocessing
+import random
+import os
+from math import hypot
+import pickle
 
 
 #################
@@ -64,6 +74,92 @@ def about(topic):
     return helper
 
 
+class ParagraphCorpus:
+    """A list of PARAGRAPHS that are each split into lowercase words without
+    punctuation once, with an index from each word to the positions of the
+    paragraphs that contain it.
+
+    >>> corpus = ParagraphCorpus(['Cute Dog!', 'That is a cat.', 'Nice pup.', 'A dog and a cat'])
+    >>> corpus.pick(['dog', 'dogs', 'pup', 'puppy'], 1)
+    'Nice pup.'
+    >>> corpus.pick(['dog', 'cat'], 1, match_all=True)
+    ''
+    >>> corpus.pick(['dog', 'cat'], 0, match_all=True)
+    'A dog and a cat'
+    >>> corpus.positions(['cat', 'pup'])
+    [1, 2, 3]
+    """
+
+    def __init__(self, paragraphs):
+        self.paragraphs = list(paragraphs)
+        self.index = {}
+        for i, paragraph in enumerate(self.paragraphs):
+            for word in set(split(lower(remove_punctuation(paragraph)))):
+                self.index.setdefault(word, []).append(i)
+
+    @classmethod
+    def from_file(cls, path):
+        """Return a ParagraphCorpus of the lines of the file at PATH."""
+        return cls(lines_from_file(path))
+
+    def matches(self, topic, match_all=False):
+        """Return an iterator over the positions of the paragraphs containing
+        any of the words in TOPIC, or all of them if MATCH_ALL, in order.
+        """
+        assert all(lower(x) == x for x in topic), 'topics should be lowercase.'
+        lists = [self.index.get(word, []) for word in set(topic)]
+        if match_all:
+            return self.intersect_positions(lists)
+        return self.merge_positions(lists)
+
+    @staticmethod
+    def intersect_positions(lists):
+        """Yield each position that is in all of the sorted LISTS, in increasing
+        order, walking the shortest list and bisecting into the others, so that
+        finding the first few costs little however long the other lists are.
+
+        >>> list(ParagraphCorpus.intersect_positions([[1, 4, 6, 9], [0, 1, 2, 6, 9], [6, 9]]))
+        [6, 9]
+        """
+        if not lists:
+            return
+        shortest = min(lists, key=len)
+        others = [positions for positions in lists if positions is not shortest]
+        starts = [0] * len(others)
+        for i in shortest:
+            for j, positions in enumerate(others):
+                starts[j] = bisect_left(positions, i, starts[j])
+                if starts[j] == len(positions):
+                    return
+                if positions[starts[j]] != i:
+                    break
+            else:
+                yield i
+
+    @staticmethod
+    def merge_positions(lists):
+        """Yield each position in the sorted LISTS once, in increasing order."""
+        last = None
+        for i in merge(*lists):
+            if i != last:
+                yield i
+                last = i
+
+    def positions(self, topic, match_all=False):
+        """Return a list of the positions of the paragraphs about TOPIC."""
+        return list(self.matches(topic, match_all))
+
+    def pick(self, topic, k, match_all=False):
+        """Return the Kth paragraph containing any of the words in TOPIC (all of
+        them if MATCH_ALL), like pick(paragraphs, about(topic), k), or the empty
+        string if there are not that many.
+        """
+        for count, i in enumerate(self.matches(topic, match_all)):
+            if count == k:
+                return self.paragraphs[i]
+        return ''
+
+
 def accuracy(typed, reference):
     """Return the accuracy (percentage of words typed correctly) of TYPED
     when compared to the prefix of REFERENCE that was typed.
@@ -117,6 +213,82 @@ def wpm(typed, elapsed):
     assert elapsed > 0, 'Elapsed time must be positive'
     return len(typed)/5*60/elapsed
 
+
+class TypingSession:
+    """The state of typing REFERENCE one keystroke at a time, from which
+    accuracy and wpm are available after every keystroke without re-reading
+    everything typed so far.
+
+    >>> session = TypingSession('Cute Dog.')
+    >>> session.type('cute Dog. I')
+    >>> session.accuracy(), accuracy('cute Dog. I', 'Cute Dog.')
+    (33.33333333333333, 33.33333333333333)
+    >>> session.type(TypingSession.BACKSPACE * 11 + 'Cute Dog.')
+    >>> session.typed, session.accuracy(), session.wpm(10)
+    ('Cute Dog.', 100.0, 10.8)
+    """
+    BACKSPACE = '\b'
+
+    def __init__(self, reference):
+        self.reference_words = split(reference)
+        self.keys = []      # Every character typed so far
+        self.words = []     # The words completed by whitespace
+        self.correct = 0    # How many of those words match REFERENCE
+        self.current = ''   # The word being typed
+
+    def matches(self, word, i):
+        return i < len(self.reference_words) and word == self.reference_words[i]
+
+    def keystroke(self, key):
+        """Type the character KEY, or delete the last one if it is BACKSPACE."""
+        if key == self.BACKSPACE:
+            if not self.keys:
+                return
+            if not self.keys.pop().isspace():
+                self.current = self.current[:-1]
+            elif self.keys and not self.keys[-1].isspace():
+                # The deleted whitespace ended the previous word; reopen it.
+                self.current = self.words.pop()
+                if self.matches(self.current, len(self.words)):
+                    self.correct -= 1
+        elif key.isspace():
+            if self.current:
+                if self.matches(self.current, len(self.words)):
+                    self.correct += 1
+                self.words.append(self.current)
+                self.current = ''
+            self.keys.append(key)
+        else:
+            self.current += key
+            self.keys.append(key)
+
+    def type(self, keys):
+        """Type each character of KEYS in turn."""
+        for key in keys:
+            self.keystroke(key)
+
+    @property
+    def typed(self):
+        return ''.join(self.keys)
+
+    def accuracy(self):
+        """Return accuracy(self.typed, reference)."""
+        typed_count, count = len(self.words), self.correct
+        if self.current:
+            typed_count += 1
+            if self.matches(self.current, len(self.words)):
+                count += 1
+        if typed_count == 0 and len(self.reference_words) == 0:
+            return 100.0
+        if typed_count == 0 or len(self.reference_words) == 0:
+            return 0.0
+        return count/typed_count*100
+
+    def wpm(self, elapsed):
+        """Return wpm(self.typed, ELAPSED)."""
+        assert elapsed > 0, 'Elapsed time must be positive'
+        return len(self.keys)/5*60/elapsed
+
 #####################
 # Part 2 Autocorrect#
 #####################
@@ -178,18 +350,20 @@ def feline_fixes(typed, reference, limit):
     5
     >>> feline_fixes("rose", "hello", big_limit)   # Substitute: r->h, o->e, s->l, e->l, length difference of 1.
     5
+    >>> feline_fixes("a" * 5000, "b" * 5000, 3)    # Stops counting after the limit
+    4
     """
     if typed == reference:
         return 0
-    if limit == 0:
-        return 1
-    diff = 0
-    if typed == '' or reference == '':
-        return min(abs(len(typed) - len(reference)), limit + 1)
-
-    if typed[0] != reference[0]:
-        diff += 1
-    return diff + feline_fixes(typed[1:], reference[1:], limit-diff)
+    diff = abs(len(typed) - len(reference))
+    if diff > limit:
+        return limit + 1
+    for i in range(min(len(typed), len(reference))):
+        if typed[i] != reference[i]:
+            diff += 1
+            if diff > limit:
+                return limit + 1
+    return diff
 
 
 def hidden_kittens(typed, reference, limit):
@@ -209,14 +383,45 @@ def hidden_kittens(typed, reference, limit):
     True
     >>> hidden_kittens("hiddnehddi", "hidden", limit) > limit # hidden appears 0 times in hiddnehddi
     True
+    >>> hidden_kittens("ab" * 50, "ab", 10000)  # 50 + 49 + ... + 1
+    1275
+    >>> hidden_kittens("123" * 1000, "123", limit) > limit
+    True
     """
-    numHK = helperHK(typed, reference, limit)
-    if numHK == 0 or numHK > limit:
-        return limit + 1
-    return numHK
+    # counts[j] is the number of times reference[:j] appears in the part of
+    # TYPED read so far, capped at LIMIT + 1.
+    too_many = limit + 1
+    counts = [1] + [0] * len(reference)
+    positions = {}  # Each character of REFERENCE -> its positions + 1, descending
+    for j in range(len(reference), 0, -1):
+        positions.setdefault(reference[j - 1], []).append(j)
+    for t in typed:
+        for j in positions.get(t, ()):
+            counts[j] = min(counts[j] + counts[j - 1], too_many)
+        if counts[-1] > limit:
+            return too_many
+    if counts[-1] == 0 or counts[-1] > limit:
+        return too_many
+    return counts[-1]
 
 
 def helperHK(typed, reference, limit):
+    """Return the number of times REFERENCE appears as a subsequence of TYPED
+    by trying every way to match each character. This takes exponential time,
+    so it is only a reference for hidden_kittens on small inputs.
+
+    >>> from itertools import product
+    >>> words = [''.join(w) for n in range(6) for w in product('ab', repeat=n)]
+    >>> def slow_hidden_kittens(typed, reference, limit):
+    ...     num = helperHK(typed, reference, limit)
+    ...     return limit + 1 if num == 0 or num > limit else num
+    >>> all(hidden_kittens(t, r, limit) == slow_hidden_kittens(t, r, limit)
+    ...     for t in words for r in words[:15] for limit in range(5))
+    True
+    >>> all(hidden_kittens(t, r, 100) == slow_hidden_kittens(t, r, 100)
+    ...     for t in ['ccatgts', 'cacacats', 'tacocat'] for r in ['cat', 'cats', 'at', ''])
+    True
+    """
     if reference == typed:
         return 1
     if len(reference) == 0:
@@ -233,8 +438,420 @@ def helperHK(typed, reference, limit):
 
 def final_diff(typed, reference, limit):
     """A diff function that takes in a string TYPED, a string REFERENCE, and a number LIMIT.
-    If you implement this function, it will be used."""
-    ...
+    If you implement this function, it will be used.
+
+    Returns the edit distance between TYPED and REFERENCE: the fewest
+    single-character insertions, deletions and substitutions that turn one into
+    the other, or LIMIT + 1 if that is more than LIMIT. Only the cells of the
+    edit distance table within LIMIT of its diagonal are computed, since every
+    other cell is already more than LIMIT.
+
+    >>> big_limit = 10
+    >>> final_diff("cats", "scat", big_limit)      # Insert s, delete s
+    2
+    >>> final_diff("purng", "purring", big_limit)  # Insert r, insert i
+    2
+    >>> final_diff("ckiteus", "kittens", big_limit)
+    3
+    >>> final_diff("ckiteus", "kittens", 1)
+    2
+    >>> final_diff("", "abc", big_limit), final_diff("abc", "", 1)
+    (3, 2)
+    """
+    if typed == reference:
+        return 0
+    too_far = limit + 1
+    if abs(len(typed) - len(reference)) > limit:
+        return too_far
+    previous = [min(j, too_far) for j in range(len(reference) + 1)]
+    current = [too_far] * (len(reference) + 1)
+    for i in range(1, len(typed) + 1):
+        low, high = max(1, i - limit), min(len(reference), i + limit)
+        current[low - 1] = min(i, too_far) if low == 1 else too_far
+        row_min = current[low - 1]
+        t = typed[i - 1]
+        for j in range(low, high + 1):
+            diff = previous[j - 1] + (t != reference[j - 1])
+            if previous[j] + 1 < diff:
+                diff = previous[j] + 1
+            if current[j - 1] + 1 < diff:
+                diff = current[j - 1] + 1
+            current[j] = diff
+            if diff < row_min:
+                row_min = diff
+        if high < len(reference):
+            current[high + 1] = too_far
+        if row_min > limit:
+            return too_far
+        previous, current = current, previous
+    return min(previous[len(reference)], too_far)
+
+
+# Each QWERTY row with its unshifted and shifted characters and how far its
+# first key is to the right of the backtick key, in key widths.
+KEYBOARD_ROWS = [('`1234567890-=', '~!@#$%^&*()_+', 0),
+                 ('qwertyuiop[]\\', 'QWERTYUIOP{}|', 1.5),
+                 ("asdfghjkl;'", 'ASDFGHJKL:"', 1.75),
+                 ('zxcvbnm,./', 'ZXCVBNM<>?', 2.25)]
+ASCII = 128
+
+
+def key_substitution_costs(rows=KEYBOARD_ROWS):
+    """Return a flat list of the cost of typing one ASCII character in place of
+    another, indexed by ASCII * ord(typed) + ord(reference). Characters on the
+    same key cost 0.25, and the cost grows by 0.25 per key of distance up to 1,
+    which is also the cost of any character that is not on the keyboard.
+
+    >>> costs = key_substitution_costs()
+    >>> [costs[ASCII * ord(t) + ord(r)] for t, r in ['aa', 'aA', 'as', 'ap', ' a']]
+    [0, 0.25, 0.5, 1, 1]
+    >>> [round(costs[ASCII * ord('q') + ord(r)], 2) for r in '123']  # q is under 1 and 2
+    [0.53, 0.53, 0.7]
+    """
+    positions = {}
+    for y, (keys, shifted_keys, offset) in enumerate(rows):
+        for x, (key, shifted_key) in enumerate(zip(keys, shifted_keys)):
+            positions[key] = positions[shifted_key] = (y, x + offset)
+    costs = [1] * (ASCII * ASCII)
+    for t in range(ASCII):
+        costs[ASCII * t + t] = 0
+    for t, (ty, tx) in positions.items():
+        for r, (ry, rx) in positions.items():
+            if t != r:
+                distance = hypot(ty - ry, tx - rx)
+                costs[ASCII * ord(t) + ord(r)] = min(1, 0.25 + 0.25 * distance)
+    return costs
+
+
+KEY_SUBSTITUTION_COSTS = key_substitution_costs()
+
+
+def keyboard_diff(typed, reference, limit):
+    """A diff function like final_diff in which substituting one character for
+    another costs less the closer their keys are on a QWERTY keyboard, as given
+    by KEY_SUBSTITUTION_COSTS. Insertions and deletions cost 1. Returns LIMIT + 1
+    if the cost is more than LIMIT.
+
+    >>> keyboard_diff("cst", "cat", 2)      # s is next to a
+    0.5
+    >>> keyboard_diff("Cat", "cat", 2)      # Same key, shifted
+    0.25
+    >>> keyboard_diff("cpt", "cat", 2), keyboard_diff("ct", "cat", 2)
+    (1, 1)
+    >>> keyboard_diff("dog", "cat", 2), keyboard_diff("ab", "ba", 1.5)
+    (3, 2.5)
+    >>> autocorrect("cst", ["cut", "cat", "cot"], keyboard_diff, 1)
+    'cat'
+    """
+    if typed == reference:
+        return 0
+    too_far = limit + 1
+    if abs(len(typed) - len(reference)) > limit:
+        return too_far
+    costs = KEY_SUBSTITUTION_COSTS
+    # Characters past ASCII share the last row and column, which cost 1.
+    codes = [min(ord(r), ASCII - 1) for r in reference]
+    band = int(limit)
+    previous = [min(j, too_far) for j in range(len(reference) + 1)]
+    current = [too_far] * (len(reference) + 1)
+    for i in range(1, len(typed) + 1):
+        low, high = max(1, i - band), min(len(reference), i + band)
+        current[low - 1] = min(i, too_far) if low == 1 else too_far
+        row_min = current[low - 1]
+        t = typed[i - 1]
+        row = ASCII * min(ord(t), ASCII - 1)
+        for j in range(low, high + 1):
+            diff = previous[j - 1]
+            if t != reference[j - 1]:
+                diff += costs[row + codes[j - 1]] or 1  # Two non-ASCII characters
+            if previous[j] + 1 < diff:
+                diff = previous[j] + 1
+            if current[j - 1] + 1 < diff:
+                diff = current[j - 1] + 1
+            current[j] = diff
+            if diff < row_min:
+                row_min = diff
+        if high < len(reference):
+            current[high + 1] = too_far
+        if row_min > limit:
+            return too_far
+        previous, current = current, previous
+    diff = previous[len(reference)]
+    return diff if diff <= limit else too_far
+
+
+class CorrectionCache:
+    """A least-recently-used cache of autocorrect results that holds at most
+    MAXSIZE corrections and counts its hits, misses and evictions.
+
+    Corrections are kept per word list. Call invalidate(word_list) after
+    changing a word list in place, so that its old corrections are dropped.
+
+    >>> cache = CorrectionCache(maxsize=2)
+    >>> words = ['butter', 'hello', 'potato']
+    >>> cache.autocorrect('hwllo', words, feline_fixes, 2)
+    'hello'
+    >>> cache.autocorrect('hwllo', words, feline_fixes, 2)
+    'hello'
+    >>> cache.autocorrect('buttar', words, feline_fixes, 2)
+    'butter'
+    >>> cache.autocorrect('potatp', words, feline_fixes, 2)  # Evicts 'hwllo'
+    'potato'
+    >>> cache.hits, cache.misses, cache.evictions, cache.hit_rate()
+    (1, 3, 1, 0.25)
+    >>> words.append('hwllo')
+    >>> cache.invalidate(words)
+    >>> cache.autocorrect('potatp', words, feline_fixes, 2), len(cache)
+    ('potato', 1)
+
+    A word list is only kept while the cache holds corrections for it.
+
+    >>> for i in range(100):
+    ...     _ = cache.autocorrect('hwllo', ['hello', str(i)], feline_fixes, 2)
+    >>> len(cache), len(cache.word_lists)
+    (2, 2)
+    """
+
+    def __init__(self, maxsize=4096):
+        assert maxsize > 0, 'The cache must hold at least one correction'
+        self.maxsize = maxsize
+        self.hits = self.misses = self.evictions = 0
+        self.entries = OrderedDict()  # Key -> correction, least recent first
+        # id(word list) -> [word list, number of entries]. Holding on to a word
+        # list while it has entries keeps its id from being reused.
+        self.word_lists = {}
+
+    def get(self, typed_word, word_list, diff_function, limit):
+        """Return the cached correction, or None if there is none."""
+        key = typed_word, id(word_list), diff_function, limit
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, typed_word, word_list, diff_function, limit, correction):
+        key = typed_word, id(word_list), diff_function, limit
+        if key not in self.entries:
+            self.word_lists.setdefault(id(word_list), [word_list, 0])[1] += 1
+        self.entries[key] = correction
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            evicted, _ = self.entries.popitem(last=False)
+            self.evictions += 1
+            registered = self.word_lists[evicted[1]]
+            registered[1] -= 1
+            if registered[1] == 0:
+                del self.word_lists[evicted[1]]
+
+    def autocorrect(self, typed_word, word_list, diff_function, limit):
+        """Return autocorrect(TYPED_WORD, WORD_LIST, DIFF_FUNCTION, LIMIT),
+        computing it only if it is not cached.
+        """
+        correction = self.get(typed_word, word_list, diff_function, limit)
+        if correction is None:
+            correction = autocorrect(typed_word, word_list, diff_function, limit)
+            self.put(typed_word, word_list, diff_function, limit, correction)
+        return correction
+
+    def invalidate(self, word_list=None):
+        """Drop the corrections for WORD_LIST, or all of them if it is None."""
+        if word_list is None:
+            self.entries.clear()
+            self.word_lists.clear()
+        elif id(word_list) in self.word_lists:
+            for key in [key for key in self.entries if key[1] == id(word_list)]:
+                del self.entries[key]
+            del self.word_lists[id(word_list)]
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def autocorrect_many(typed_words, word_list, diff_function, limit,
+                     processes=None, cache=None, min_parallel=64, pool=None):
+    """Return a list of autocorrect(w, WORD_LIST, DIFF_FUNCTION, LIMIT) for
+    each word w of TYPED_WORDS.
+
+    Each distinct word is only corrected once, and CACHE, if it is a
+    CorrectionCache, is consulted first and given every new correction. If
+    there are at least MIN_PARALLEL words left to correct, they are split
+    across POOL, an AutocorrectPool for the same arguments, or otherwise across
+    a new pool of PROCESSES processes (by default one per CPU). In either case
+    DIFF_FUNCTION must be picklable, e.g. a module-level function.
+
+    >>> words = ['butter', 'hello', 'potato']
+    >>> autocorrect_many(['hwllo', 'potatp', 'hwllo', 'xyzzy'], words, feline_fixes, 2)
+    ['hello', 'potato', 'hello', 'xyzzy']
+    >>> cache = CorrectionCache()
+    >>> autocorrect_many(['buttar'] * 100, words, feline_fixes, 2, cache=cache)[:2]
+    ['butter', 'butter']
+    >>> autocorrect_many(['buttar', 'hwllo'], words, feline_fixes, 2, cache=cache)
+    ['butter', 'hello']
+    >>> cache.hits, cache.misses
+    (1, 2)
+    >>> with AutocorrectPool(words, feline_fixes, 2, processes=2) as pool:
+    ...     autocorrect_many(['hwllo', 'potatp'], words, feline_fixes, 2,
+    ...                      min_parallel=1, pool=pool)
+    ['hello', 'potato']
+    """
+    if pool is not None:
+        assert (pool.word_list, pool.diff_function, pool.limit) == \
+            (word_list, diff_function, limit), 'The pool is for other arguments'
+    corrections = {}
+    missing = []
+    for w in dict.fromkeys(typed_words):
+        if cache is not None:
+            corrections[w] = cache.get(w, word_list, diff_function, limit)
+        if corrections.get(w) is None:
+            missing.append(w)
+    if len(missing) < min_parallel or (processes == 1 and pool is None):
+        corrected = [autocorrect(w, word_list, diff_function, limit) for w in missing]
+    elif pool is not None:
+        corrected = pool.map(missing)
+    else:
+        with AutocorrectPool(word_list, diff_function, limit, processes) as pool:
+            corrected = pool.map(missing)
+    for w, correction in zip(missing, corrected):
+        corrections[w] = correction
+        if cache is not None:
+            cache.put(w, word_list, diff_function, limit, correction)
+    return [corrections[w] for w in typed_words]
+
+
+class AutocorrectPool:
+    """A pool of PROCESSES worker processes (by default one per CPU) that each
+    hold a copy of WORD_LIST, DIFF_FUNCTION and LIMIT, so that a long-running
+    caller can pass it to autocorrect_many again and again without sending the
+    word list each time. Changes made to WORD_LIST later do not reach the
+    workers. Close the pool, or use it in a with statement, when done.
+    """
+
+    def __init__(self, word_list, diff_function, limit, processes=None):
+        self.word_list = word_list
+        self.diff_function = diff_function
+        self.limit = limit
+        self.processes = processes or os.cpu_count()
+        self.pool = multiprocessing.Pool(self.processes, _start_autocorrect_worker,
+                                         (word_list, diff_function, limit))
+
+    def map(self, typed_words):
+        """Return the autocorrection of each of TYPED_WORDS."""
+        return self.pool.map(_autocorrect_worker, typed_words,
+                             max(1, len(typed_words) // (4 * self.processes)))
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_worker_autocorrect_args = None  # (word_list, diff_function, limit) in a worker
+
+
+def _start_autocorrect_worker(word_list, diff_function, limit):
+    global _worker_autocorrect_args
+    _worker_autocorrect_args = (word_list, diff_function, limit)
+
+
+def _autocorrect_worker(typed_word):
+    return autocorrect(typed_word, *_worker_autocorrect_args)
+
+
+class WordIndex:
+    """A BK-tree over the words of WORD_LIST that answers autocorrect queries
+    while only comparing TYPED_WORD to the words that could be within LIMIT.
+
+    DIFF_FUNCTION must be a metric, like feline_fixes: it is zero only for equal
+    words, symmetric, and satisfies the triangle inequality. Every word is
+    stored in a node whose children are keyed by their difference from it,
+    which bounds the differences of everything below each child.
+
+    >>> words = ['butter', 'hello', 'potato', 'hallo', 'jello']
+    >>> index = WordIndex(words, feline_fixes)
+    >>> index.autocorrect('hwllo', 2), autocorrect('hwllo', words, feline_fixes, 2)
+    ('hello', 'hello')
+    >>> index.autocorrect('zzzzzz', 2)
+    'zzzzzz'
+    >>> index.autocorrect('hallo', 2)
+    'hallo'
+    """
+
+    def __init__(self, word_list, diff_function):
+        self.diff_function = diff_function
+        self.words = set(word_list)
+        self.root = None  # A node is a [word, position in word list, children] list
+        for i, word in enumerate(word_list):
+            self.insert(word, i)
+
+    def difference(self, typed_word, word):
+        """Return the exact difference, with a limit no difference can reach."""
+        return self.diff_function(typed_word, word, len(typed_word) + len(word))
+
+    def insert(self, word, position):
+        if self.root is None:
+            self.root = [word, position, {}]
+            return
+        node = self.root
+        while node[0] != word:
+            diff = self.difference(word, node[0])
+            if diff not in node[2]:
+                node[2][diff] = [word, position, {}]
+                return
+            node = node[2][diff]
+
+    def autocorrect(self, typed_word, limit):
+        """Return the same word as autocorrect(TYPED_WORD, word_list,
+        diff_function, LIMIT): the earliest word of the list with the smallest
+        difference, or TYPED_WORD if that difference is greater than LIMIT.
+        """
+        if typed_word in self.words or self.root is None:
+            return typed_word
+        lowest, lowest_position, lowest_s = limit + 1, -1, typed_word
+        nodes = [self.root]
+        while nodes:
+            word, position, children = nodes.pop()
+            diff = self.difference(typed_word, word)
+            if diff < lowest or diff == lowest and position < lowest_position:
+                lowest, lowest_position, lowest_s = diff, position, word
+            radius = min(lowest, limit)
+            for key, child in children.items():
+                if diff - radius <= key <= diff + radius:
+                    nodes.append(child)
+        return lowest_s
+
+    def save(self, path):
+        """Write this index to PATH, so it can be loaded instead of rebuilt."""
+        with open(path, 'wb') as f:
+            pickle.dump(self, f)
+
+    @classmethod
+    def load(cls, path):
+        """Return the WordIndex saved at PATH."""
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+def run_benchmarks():
+    """Time the diff functions and autocorrect on typical and long words."""
+    from timeit import timeit
+    pairs = [('speling', 'spelling'), ('acommodate', 'accommodate'),
+             ('x' * 200 + 'y', 'x' * 200 + 'z')]
+    for diff_function in [feline_fixes, final_diff, keyboard_diff]:
+        for typed, reference in pairs:
+            elapsed = timeit(lambda: diff_function(typed, reference, 3), number=10000)
+            print('{}({} chars, limit 3): {:.2f}us'.format(
+                diff_function.__name__, len(typed), elapsed / 10000 * 1e6))
 
 
 #####################
@@ -278,6 +895,163 @@ def report_progress(typed, prompt, user_id, upload):
     return count_right / len(prompt)
 
 
+def typed_progress(typed, prompt):
+    """Return the fraction of the words in PROMPT that TYPED, a list of words,
+    matches before its first mistake, as reported by report_progress.
+
+    >>> typed_progress(['how', 'aree'], ['how', 'are', 'you', 'doing', 'today'])
+    0.2
+    """
+    count_right = 0
+    for x, y in zip(typed, prompt):
+        if x != y:
+            break
+        count_right += 1
+    return count_right / len(prompt)
+
+
+class LocalProgressServer:
+    """An in-process stand-in for the multiplayer server that keeps the latest
+    progress of every player from the batches uploaded to it.
+    """
+
+    def __init__(self):
+        self.progress = {}
+        self.uploads = 0
+
+    def upload(self, batch):
+        self.uploads += 1
+        self.progress.update(batch['progress'])
+
+
+class ProgressHub:
+    """Collects progress reports from many players and, once every TICK
+    seconds, uploads and broadcasts them as a single batch. Only the latest
+    progress of each player within a tick is kept, along with the time of
+    their first report in that tick. Each batch holds the new
+    progress by player id and a leaderboard of the LEADERBOARD_SIZE players
+    with the most progress.
+
+    >>> server = LocalProgressServer()
+    >>> hub = ProgressHub(server.upload)
+    >>> prompt = ['how', 'are', 'you', 'doing', 'today']
+    >>> hub.report(['how', 'are'], prompt, 1)
+    0.4
+    >>> hub.report(['how', 'are', 'you'], prompt, 1)
+    0.6
+    >>> hub.report(['who'], prompt, 2)
+    0.0
+    >>> hub.flush()
+    {'progress': {1: 0.6, 2: 0.0}, 'leaderboard': [(1, 0.6), (2, 0.0)]}
+    >>> server.uploads, server.progress
+    (1, {1: 0.6, 2: 0.0})
+    """
+
+    def __init__(self, upload, tick=0.1, leaderboard_size=10):
+        self.upload = upload
+        self.tick = tick
+        self.leaderboard_size = leaderboard_size
+        self.pending = {}      # Player id -> (progress, time first reported) this tick
+        self.progress = {}     # Player id -> latest progress broadcast
+        self.subscribers = []  # asyncio.Queues that receive every batch
+        self.latencies = None  # If a list, seconds from each player's first
+                               # report in a batch to the batch being sent
+
+    def report(self, typed, prompt, user_id):
+        """Record the progress of USER_ID for the next batch and return it."""
+        progress = typed_progress(typed, prompt)
+        self.submit(user_id, progress)
+        return progress
+
+    def submit(self, user_id, progress):
+        if user_id in self.pending:
+            reported = self.pending[user_id][1]
+        else:
+            reported = perf_counter()
+        self.pending[user_id] = (progress, reported)
+
+    def subscribe(self):
+        """Return an asyncio.Queue that receives every batch from now on."""
+        queue = asyncio.Queue()
+        self.subscribers.append(queue)
+        return queue
+
+    def flush(self):
+        """Upload and broadcast the reports since the last flush, if any, and
+        return the batch.
+        """
+        if not self.pending:
+            return None
+        pending, self.pending = self.pending, {}
+        updates = {user_id: progress for user_id, (progress, _) in pending.items()}
+        self.progress.update(updates)
+        leaderboard = nlargest(self.leaderboard_size, self.progress.items(),
+                               key=lambda item: item[1])
+        batch = {'progress': updates, 'leaderboard': leaderboard}
+        self.upload(batch)
+        for queue in self.subscribers:
+            queue.put_nowait(batch)
+        if self.latencies is not None:
+            sent = perf_counter()
+            self.latencies.extend(sent - reported for _, reported in pending.values())
+        return batch
+
+    async def run(self):
+        """Flush once per tick until cancelled."""
+        try:
+            while True:
+                await asyncio.sleep(self.tick)
+                self.flush()
+        finally:
+            self.flush()
+
+
+async def load_test_hub(num_players=1000, reports_per_player=20, tick=0.05,
+                        typing_delay=0.01):
+    """Load test a ProgressHub with a LocalProgressServer. Return the number of
+    reports per second the hub can handle and the 99th percentile latency of
+    a report, in seconds.
+
+    Throughput is measured with NUM_PLAYERS players sending REPORTS_PER_PLAYER
+    reports each as fast as possible, flushing a batch after every round of
+    one report per player, so it includes the cost of the flushes.
+
+    Latency is measured in a second run in which the players pause about
+    TYPING_DELAY seconds between reports while the hub flushes every TICK
+    seconds. For each player in each batch, it is the time from the first of
+    their reports that the batch coalesced until the batch was uploaded and
+    broadcast, which is the longest any of those reports waited.
+    """
+    server = LocalProgressServer()
+    hub = ProgressHub(server.upload, tick)
+    prompt = ['word'] * reports_per_player
+    start = perf_counter()
+    for typed_count in range(1, reports_per_player + 1):
+        for user_id in range(num_players):
+            hub.report(prompt[:typed_count], prompt, user_id)
+        hub.flush()
+    throughput = num_players * reports_per_player / (perf_counter() - start)
+
+    hub = ProgressHub(server.upload, tick)
+    hub.latencies = []
+
+    async def player(user_id):
+        for typed_count in range(1, reports_per_player + 1):
+            await asyncio.sleep(random.uniform(0, 2 * typing_delay))
+            hub.report(prompt[:typed_count], prompt, user_id)
+
+    running = asyncio.ensure_future(hub.run())
+    await asyncio.gather(*[player(user_id) for user_id in range(num_players)])
+    running.cancel()
+    try:
+        await running
+    except asyncio.CancelledError:
+        pass
+    latencies = sorted(hub.latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return throughput, p99
+
+
 def time_per_word(words, times_per_player):
     """Given timing data, return a match dictionary, which contains a
     list of words and the amount of time each player took to type each word.
@@ -355,13 +1129,13 @@ def match(words, times):
         words: ['Hello', 'world']
         times: [[5, 1], [4, 2]]
     """
-    assert all([type(w) == str for w in words]
+    assert all(type(w) == str for w in words
                ), 'words should be a list of strings'
-    assert all([type(t) == list for t in times]
+    assert all(type(t) == list for t in times
                ), 'times should be a list of lists'
-    assert all([isinstance(i, (int, float))
-               for t in times for i in t]), 'times lists should contain numbers'
-    assert all([len(t) == len(words) for t in times]
+    assert all(isinstance(i, (int, float))
+               for t in times for i in t), 'times lists should contain numbers'
+    assert all(len(t) == len(words) for t in times
                ), 'There should be one word per time.'
     return {"words": words, "times": times}
 
@@ -378,6 +1152,87 @@ def match_string(match):
     ...
 
 
+class ColumnarMatch:
+    """A match whose times are a NumPy array with a row for each player and a
+    column for each word, for matches with many players and words. It converts
+    to and from the match dictionaries used by the functions above.
+
+    >>> p = [[75, 81, 84, 90, 92], [19, 29, 35, 36, 38]]
+    >>> columns = ColumnarMatch.from_timestamps(['collar', 'plush', 'blush', 'repute'], p)
+    >>> columns.to_match() == time_per_word(['collar', 'plush', 'blush', 'repute'], p)
+    True
+    >>> columns.fastest_words() == fastest_words(columns.to_match())
+    True
+    >>> columns.fastest_words()
+    [['collar', 'plush', 'repute'], ['blush']]
+    >>> columns.words_won().tolist(), columns.total_times().tolist()
+    ([3, 1], [17, 19])
+    """
+
+    def __init__(self, words, times):
+        import numpy as np
+        self.words = list(words)
+        self.times = np.asarray(times)
+        if self.times.size == 0:
+            self.times = self.times.reshape(len(times), len(self.words))
+        assert self.times.ndim == 2 and self.times.shape[1] == len(self.words), \
+            'There should be one word per time.'
+
+    @classmethod
+    def from_timestamps(cls, words, times_per_player):
+        """Return the ColumnarMatch that time_per_word would return as a
+        dictionary for WORDS and TIMES_PER_PLAYER.
+
+        >>> ColumnarMatch.from_timestamps([], []).to_match() == time_per_word([], [])
+        True
+        """
+        import numpy as np
+        timestamps = np.asarray(times_per_player)
+        if timestamps.size == 0:
+            timestamps = timestamps.reshape(len(times_per_player), len(words) + 1)
+        return cls(words, np.diff(timestamps, axis=1))
+
+    @classmethod
+    def from_match(cls, match):
+        return cls(match["words"], match["times"])
+
+    def to_match(self):
+        return match(self.words, self.times.tolist())
+
+    def fastest_players(self):
+        """Return an array of the player who typed each word fastest, the
+        first such player in case of a tie.
+        """
+        return self.times.argmin(axis=0)
+
+    def fastest_words(self):
+        """Return fastest_words(self.to_match()) without building it."""
+        import numpy as np
+        if self.times.shape[0] == 0:
+            return []
+        fastest = self.fastest_players()
+        order = np.argsort(fastest, kind='stable')
+        ends = np.cumsum(self.words_won(fastest))
+        words = np.array(self.words, dtype=object)
+        return [words[word_indices].tolist()
+                for word_indices in np.split(order, ends[:-1])]
+
+    def words_won(self, fastest=None):
+        """Return an array of how many words each player typed fastest."""
+        import numpy as np
+        if fastest is None:
+            fastest = self.fastest_players()
+        return np.bincount(fastest, minlength=self.times.shape[0])
+
+    def total_times(self):
+        """Return an array of the total time each player took."""
+        return self.times.sum(axis=1)
+
+    def average_times(self):
+        """Return an array of the average time each player took per word."""
+        return self.times.mean(axis=1)
+
+
 enable_multiplayer = False
 
 ...
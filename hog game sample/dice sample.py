@@ -12,9 +12,13 @@ Types of dice:
  -  A test dice is deterministic: it always cycles through a fixed
    sequence of values that are passed as arguments.
    Test dice are generated by the make_test_dice function.
+
+ -  A buffered dice is a fair dice that draws its outcomes in large blocks
+   from its own seeded random stream, and can also roll many dice at once.
+   Buffered dice are generated by the make_buffered_dice function.
 """
 
-from random import randint
+from random import randint, Random
 
 
 def make_fair_dice(sides):
@@ -58,3 +62,59 @@ def make_test_dice(*outcomes):
         index = (index + 1) % len(outcomes)
         return outcomes[index]
     return dice
+
+
+def make_buffered_dice(sides, seed=None, stream=0, block_size=4096):
+    """Return a fair die with SIDES sides that hands out outcomes from a buffer,
+    which is refilled with BLOCK_SIZE outcomes at a time when it runs out.
+
+    Dice with the same SEED and STREAM produce the same outcomes, and different
+    STREAMs of one SEED are independent, e.g. one for each worker process. A
+    SEED of None draws a fresh seed from the operating system.
+
+    The die also has a roll_many attribute: roll_many(n) returns a list of
+    the next N outcomes.
+
+    >>> a, b = make_buffered_dice(6, seed=61), make_buffered_dice(6, seed=61)
+    >>> [a() for _ in range(10)] == b.roll_many(10)
+    True
+    >>> a.roll_many(5000) == [b() for _ in range(5000)]
+    True
+    >>> sorted(set(a.roll_many(1000)))
+    [1, 2, 3, 4, 5, 6]
+    >>> c = make_buffered_dice(6, seed=61, stream=1)
+    >>> c.roll_many(20) == make_buffered_dice(6, seed=61).roll_many(20)
+    False
+    """
+    assert type(sides) == int and sides >= 1, 'Illegal value for sides'
+    if seed is None:
+        rng = Random()
+    else:
+        rng = Random('{0}:{1}'.format(seed, stream))
+    faces = range(1, sides + 1)
+    buffer = []  # Upcoming outcomes, last one first
+
+    def refill():
+        nonlocal buffer
+        buffer = rng.choices(faces, k=block_size)
+        buffer.reverse()
+
+    def dice():
+        if not buffer:
+            refill()
+        return buffer.pop()
+
+    def roll_many(n):
+        nonlocal buffer
+        if n <= len(buffer):
+            rolls = buffer[len(buffer) - n:]
+            del buffer[len(buffer) - n:]
+            rolls.reverse()
+            return rolls
+        rolls = buffer[::-1]
+        buffer = []
+        rolls.extend(rng.choices(faces, k=n - len(rolls)))
+        return rolls
+
+    dice.roll_many = roll_many
+    return dice
@@ -1,8 +1,17 @@
 """CS 61A Presents The Game of Hog."""
 
-from dice import six_sided, four_sided, make_test_dice
+from dice import six_sided, four_sided, make_test_dice, make_buffered_dice
 from ucb import main, trace, interact
 from math import sqrt
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import struct
+import time
+from collections import namedtuple
+from functools import lru_cache, partial
 
 GOAL_SCORE = 100  # The goal of Hog is to score 100 points.
 
@@ -66,13 +75,113 @@ def take_turn(num_rolls, player_score, opponent_score, dice=six_sided, goal=GOAL
         return roll_dice(num_rolls, dice)
 
 
+def turn_score_limit(goal=GOAL_SCORE, sides=6):
+    """Return a number larger than any score a player can reach during a game
+    to GOAL with SIDES-sided dice, before Pigs on Prime: a score below GOAL
+    plus at most 10 * SIDES points from rolling or 18 from Oink Points.
+    """
+    return goal + 10 * sides + 20
+
+
+def prime_sieve(limit):
+    """Return a bytearray whose Nth element is 1 if N is prime and 0 otherwise,
+    for all N below LIMIT.
+
+    >>> [n for n, prime in enumerate(prime_sieve(20)) if prime]
+    [2, 3, 5, 7, 11, 13, 17, 19]
+    """
+    sieve = bytearray([1]) * limit
+    sieve[:2] = bytes(min(limit, 2))
+    i = 2
+    while i * i < limit:
+        if sieve[i]:
+            sieve[i * i::i] = bytes(len(range(i * i, limit, i)))
+        i += 1
+    return sieve
+
+
+def next_prime_gaps(sieve):
+    """Return a list whose Nth element is the distance from N to the smallest
+    prime greater than N, or 0 if there is no such prime in SIEVE.
+
+    >>> next_prime_gaps(prime_sieve(12))
+    [2, 1, 1, 2, 1, 2, 1, 4, 3, 2, 1, 0]
+    """
+    gaps = [0] * len(sieve)
+    next_prime = None
+    for n in range(len(sieve) - 1, -1, -1):
+        if next_prime is not None:
+            gaps[n] = next_prime - n
+        if sieve[n]:
+            next_prime = n
+    return gaps
+
+
+# Primality and next-prime gaps of every score a game of Hog can reach,
+# extended by _extend_primes whenever a larger score is looked up. Numbers past
+# PRIME_TABLE_LIMIT fall back to trial division instead of growing the tables.
+PRIME_TABLE_LIMIT = 1 << 20
+_primes = bytearray()
+_prime_gaps = []
+
+
+def _extend_primes(n):
+    """Grow the prime tables so that they cover N and the next prime after N."""
+    global _primes, _prime_gaps
+    limit = max(2 * len(_primes), n + 2)
+    while True:
+        _primes = prime_sieve(limit)
+        _prime_gaps = next_prime_gaps(_primes)
+        if _prime_gaps[n]:
+            return
+        limit *= 2
+
+
+_extend_primes(turn_score_limit())
+
+
 def is_prime(n):
-    if n == 2:
-        return True
-    elif n % 2 == 0:
+    """Return whether N is prime, by looking it up in the prime tables.
+
+    >>> [is_prime(n) for n in range(-1, 6)]
+    [False, False, False, True, True, False, True]
+    >>> all(is_prime(n) == _is_prime_by_trial_division(n) for n in range(3000))
+    True
+    """
+    if n < 2:
         return False
+    if n >= PRIME_TABLE_LIMIT:
+        return _is_prime_by_trial_division(n)
+    if n >= len(_prime_gaps) or not _prime_gaps[n]:
+        _extend_primes(n)
+    return _primes[n] == 1
+
+
+def next_prime_gap(n):
+    """Return the distance from N to the smallest prime greater than N.
+
+    >>> next_prime_gap(7), next_prime_gap(8), next_prime_gap(113)
+    (4, 3, 14)
+    """
+    assert n >= 0, 'Scores cannot be negative.'
+    if n >= PRIME_TABLE_LIMIT:
+        gap = 1
+        while not _is_prime_by_trial_division(n + gap):
+            gap += 1
+        return gap
+    if n >= len(_prime_gaps) or not _prime_gaps[n]:
+        _extend_primes(n)
+    return _prime_gaps[n]
+
+
+def _is_prime_by_trial_division(n):
+    """Return whether N is prime, testing odd divisors up to its square root."""
+    if n < 2:
+        return False
+    if n % 2 == 0:
+        return n == 2
     i = 3
-    while i <= sqrt(n):
+    while i * i <= n:
         if n % i == 0:
             return False
         i += 2
@@ -85,13 +194,12 @@ def pigs_on_prime(player_score, opponent_score):
 
     player_score:   The total score of the current player.
     opponent_score: The total score of the other player.
-    """
 
+    >>> pigs_on_prime(5, 0), pigs_on_prime(23, 0), pigs_on_prime(24, 0)
+    (2, 6, 0)
+    """
     if is_prime(player_score):
-        additional = 1
-        while not is_prime(player_score + additional):
-            additional += 1
-        return additional
+        return next_prime_gap(player_score)
     else:
         return 0
 
@@ -105,7 +213,7 @@ def silence(score0, score1, leader=None):
 
 
 def play(strategy0, strategy1, score0=0, score1=0, dice=six_sided,
-         goal=GOAL_SCORE, say=silence):
+         goal=GOAL_SCORE, say=silence, trace=None):
     """Simulate a game and return the final scores of both players, with Player
     0's score first, and Player 1's score second.
 
@@ -120,20 +228,26 @@ def play(strategy0, strategy1, score0=0, score1=0, dice=six_sided,
     dice:       A function of zero arguments that simulates a dice roll.
     goal:       The game ends and someone wins when this score is reached.
     say:        The commentary function to call every turn.
+    trace:      If not None, called every turn with the player, the number of
+                dice rolled, the points scored and the Pigs on Prime bonus.
     """
     who = 0  # Who is about to take a turn, 0 (first) or 1 (second)
     leader = None
     while score0 < goal and score1 < goal:
         if who == 0:
-            turnScore = take_turn(strategy0(score0, score1),
-                                  score0, score1, dice, goal)
+            num_rolls = strategy0(score0, score1)
+            turnScore = take_turn(num_rolls, score0, score1, dice, goal)
             score0 += turnScore
-            score0 += pigs_on_prime(score0, score1)
+            bonus = pigs_on_prime(score0, score1)
+            score0 += bonus
         else:
-            turnScore = take_turn(strategy1(score1, score0),
-                                  score1, score0, dice, goal)
+            num_rolls = strategy1(score1, score0)
+            turnScore = take_turn(num_rolls, score1, score0, dice, goal)
             score1 += turnScore
-            score1 += pigs_on_prime(score1, score0)
+            bonus = pigs_on_prime(score1, score0)
+            score1 += bonus
+        if trace is not None:
+            trace(who, num_rolls, turnScore, bonus)
         who = next_player(who)
         leader, message = say(score0, score1, leader)
         if message != None and message != "":
@@ -226,6 +340,91 @@ def max_scoring_num_rolls(dice=six_sided, total_samples=1000):
     return res
 
 
+def running_stats(stats, value):
+    """Return the (count, mean, sum of squared deviations) of a sample after
+    adding VALUE to a sample with those STATS, by Welford's method.
+
+    >>> stats = (0, 0.0, 0.0)
+    >>> for value in [2, 4, 4, 4, 5, 5, 7, 9]:
+    ...     stats = running_stats(stats, value)
+    >>> stats
+    (8, 5.0, 32.0)
+    """
+    count, mean, m2 = stats
+    count += 1
+    delta = value - mean
+    mean += delta / count
+    m2 += delta * (value - mean)
+    return count, mean, m2
+
+
+def error_bar(stats, z=1.96):
+    """Return the half-width of the Z-score confidence interval for the mean of
+    a sample with STATS from running_stats.
+    """
+    count, _, m2 = stats
+    if count < 2:
+        return float('inf')
+    return z * sqrt(m2 / (count - 1) / count)
+
+
+def make_adaptive_averaged(original_function, ci_width=0.1, z=1.96,
+                           min_samples=100, max_samples=100000):
+    """Return a function that calls ORIGINAL_FUNCTION until the Z-score
+    confidence interval of the average is at most CI_WIDTH wide, or it has been
+    called MAX_SAMPLES times. The function returns the average and the
+    half-width of its confidence interval.
+
+    >>> averaged_dice = make_adaptive_averaged(roll_dice)
+    >>> averaged_dice(1, make_test_dice(3))  # No variance: stops at min_samples
+    (3.0, 0.0)
+    >>> mean, error = make_adaptive_averaged(roll_dice, ci_width=0.5)(2)
+    >>> error <= 0.25
+    True
+    """
+    def avg(*args):
+        stats = (0, 0.0, 0.0)
+        while stats[0] < max_samples:
+            stats = running_stats(stats, original_function(*args))
+            if stats[0] >= min_samples and 2 * error_bar(stats, z) <= ci_width:
+                break
+        return stats[1], error_bar(stats, z)
+    return avg
+
+
+def adaptive_max_scoring_num_rolls(dice=six_sided, batch_samples=100, z=1.96,
+                                   max_samples=10000):
+    """Return the number of dice (1 to 10) that gives the highest average turn
+    score, together with that average and the half-width of its confidence
+    interval.
+
+    All dice counts are sampled in rounds of BATCH_SAMPLES calls to roll_dice,
+    doubling each round. After each round, a count is dropped once the upper
+    end of its Z-score confidence interval falls below the lower end of another
+    count's interval, so that samples go to the counts that are still in
+    contention. Sampling stops when one count is left or a count has been
+    sampled MAX_SAMPLES times.
+
+    >>> adaptive_max_scoring_num_rolls(make_test_dice(3))
+    (10, 30.0, 0.0)
+    """
+    stats = {num_rolls: (0, 0.0, 0.0) for num_rolls in range(1, 11)}
+    remaining = list(range(1, 11))
+    samples = 0
+    while len(remaining) > 1 and samples < max_samples:
+        batch = min(batch_samples, max_samples - samples)
+        for num_rolls in remaining:
+            for _ in range(batch):
+                stats[num_rolls] = running_stats(stats[num_rolls], roll_dice(num_rolls, dice))
+        samples += batch
+        batch_samples *= 2
+        best_lower = max(stats[n][1] - error_bar(stats[n], z) for n in remaining)
+        remaining = [n for n in remaining
+                     if stats[n][1] + error_bar(stats[n], z) >= best_lower]
+    best = max(remaining, key=lambda n: (stats[n][1], -n))
+    return best, stats[best][1], error_bar(stats[best], z)
+
+
 def winner(strategy0, strategy1):
     ...
 
@@ -238,6 +437,313 @@ def run_experiments():
     ...
 
 
+###############
+# Game Traces #
+###############
+
+# Each turn is packed into 4 bytes: the player in the high and the number of
+# dice in the low 4 bits of the first byte, then the points scored and the
+# Pigs on Prime bonus. A record whose first byte is GAME_START begins a game.
+TURN_RECORD = struct.Struct('<BHB')
+GAME_START = 0xFF
+Turn = namedtuple('Turn', ['player', 'num_rolls', 'points', 'bonus'])
+
+
+class TraceWriter:
+    """A trace function for play that appends every turn to a binary FILE.
+    Call start_game before each game after the first to separate them.
+
+    >>> import io
+    >>> f = io.BytesIO()
+    >>> writer = TraceWriter(f)
+    >>> writer(0, 0, 1, 0)
+    >>> writer(1, 6, 12, 1)
+    >>> writer.start_game()
+    >>> writer(0, 10, 1, 1)
+    >>> writer.flush()
+    >>> len(f.getvalue())  # 4 bytes for each of 3 turns and 1 game header
+    16
+    >>> f.seek(0)
+    0
+    >>> for game in read_traces(f):
+    ...     print(game)
+    [Turn(player=0, num_rolls=0, points=1, bonus=0), Turn(player=1, num_rolls=6, points=12, bonus=1)]
+    [Turn(player=0, num_rolls=10, points=1, bonus=1)]
+    """
+
+    def __init__(self, file, buffer_size=1 << 16):
+        self.file = file
+        self.buffer_size = buffer_size
+        self.pending = bytearray()
+
+    def start_game(self):
+        self.pending += TURN_RECORD.pack(GAME_START, 0, 0)
+
+    def __call__(self, player, num_rolls, points, bonus):
+        self.pending += TURN_RECORD.pack(player << 4 | num_rolls, points, bonus)
+        if len(self.pending) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.pending)
+        self.pending = bytearray()
+
+
+def read_traces(file, chunk_records=1 << 14):
+    """Yield the games recorded in binary FILE by a TraceWriter, one at a time,
+    as lists of Turns. Turns recorded before the first GAME_START record form
+    a game of their own. Only CHUNK_RECORDS records are read into memory at
+    once.
+    """
+    game = None
+    while True:
+        chunk = file.read(chunk_records * TURN_RECORD.size)
+        if not chunk:
+            break
+        for first, points, bonus in TURN_RECORD.iter_unpack(chunk):
+            if first == GAME_START:
+                if game is not None:
+                    yield game
+                game = []
+            else:
+                if game is None:
+                    game = []
+                game.append(Turn(first >> 4, first & 0xF, points, bonus))
+    if game is not None:
+        yield game
+
+
+def record_games(path, strategy0, strategy1, num_games, dice=six_sided,
+                 goal=GOAL_SCORE):
+    """Play NUM_GAMES games of STRATEGY0 against STRATEGY1, streaming the trace
+    of every turn to the file at PATH.
+    """
+    with open(path, 'wb') as f:
+        writer = TraceWriter(f)
+        for _ in range(num_games):
+            writer.start_game()
+            play(strategy0, strategy1, dice=dice, goal=goal, trace=writer)
+        writer.flush()
+
+
+##################
+# Exact Analysis #
+##################
+
+
+def roll_dice_distribution(num_rolls, sides=6):
+    """Return a dictionary that maps each possible result of rolling NUM_ROLLS
+    fair SIDES-sided dice with roll_dice to the probability of that result.
+
+    >>> dist = roll_dice_distribution(2, 6)
+    >>> round(dist[1], 4)  # Sow Sad: 11 of the 36 outcomes contain a 1
+    0.3056
+    >>> round(dist[4], 4)  # Only (2, 2)
+    0.0278
+    >>> round(sum(dist.values()), 10)
+    1.0
+    """
+    assert type(num_rolls) == int, 'num_rolls must be an integer.'
+    assert num_rolls > 0, 'Must roll at least once.'
+    no_ones = {0: 1.0}
+    for _ in range(num_rolls):
+        step = {}
+        for total, p in no_ones.items():
+            for face in range(2, sides + 1):
+                step[total + face] = step.get(total + face, 0) + p / sides
+        no_ones = step
+    no_ones[1] = 1 - ((sides - 1) / sides) ** num_rolls
+    return no_ones
+
+
+@lru_cache(maxsize=None)
+def turn_distribution(num_rolls, sides=6):
+    """Return a tuple of (points, probability) pairs, in increasing order of
+    points, for rolling NUM_ROLLS fair SIDES-sided dice with roll_dice. Each
+    distribution is only computed once.
+
+    >>> [points for points, _ in turn_distribution(2, 6)][:4]
+    [1, 4, 5, 6]
+    >>> turn_distribution(1, 6) is turn_distribution(1, 6)
+    True
+    """
+    return tuple(sorted(roll_dice_distribution(num_rolls, sides).items()))
+
+
+@lru_cache(maxsize=None)
+def alias_table(num_rolls, sides=6):
+    """Return the (points, thresholds, aliases) lists of Vose's alias method
+    for turn_distribution(NUM_ROLLS, SIDES): choosing a uniform slot i and a
+    uniform u in [0, 1), the turn scores points[i] if u < thresholds[i] and
+    aliases[i] otherwise.
+    """
+    points = [k for k, _ in turn_distribution(num_rolls, sides)]
+    n = len(points)
+    scaled = [p * n for _, p in turn_distribution(num_rolls, sides)]
+    thresholds, aliases = [1.0] * n, list(points)
+    small = [i for i in range(n) if scaled[i] < 1]
+    large = [i for i in range(n) if scaled[i] >= 1]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        thresholds[less], aliases[less] = scaled[less], points[more]
+        scaled[more] -= 1 - scaled[less]
+        if scaled[more] < 1:
+            small.append(more)
+        else:
+            large.append(more)
+    return points, thresholds, aliases
+
+
+def sample_turn(num_rolls, sides=6, rng=random):
+    """Return a random result of roll_dice(NUM_ROLLS, dice) for a fair
+    SIDES-sided dice, using one random number instead of one per dice.
+
+    >>> sample_turn(10, 1)  # Every roll of a one-sided dice is a 1
+    1
+    >>> all(sample_turn(2, 6) in (1, 4, 5, 6, 7, 8, 9, 10, 11, 12) for _ in range(1000))
+    True
+    """
+    assert num_rolls > 0, 'Must roll at least once.'
+    points, thresholds, aliases = alias_table(num_rolls, sides)
+    u = rng.random() * len(points)
+    i = int(u)
+    if u - i < thresholds[i]:
+        return points[i]
+    return aliases[i]
+
+
+def expected_turn_score(num_rolls, sides=6):
+    """Return the exact expected result of roll_dice(NUM_ROLLS, dice) for a
+    fair SIDES-sided dice.
+
+    >>> round(expected_turn_score(1, 6), 10)
+    3.5
+    """
+    return sum(k * p for k, p in turn_distribution(num_rolls, sides))
+
+
+def exact_max_scoring_num_rolls(sides=6):
+    """Return the number of dice (1 to 10) that gives the highest expected turn
+    score for a fair SIDES-sided dice, computed exactly instead of sampled.
+
+    >>> exact_max_scoring_num_rolls(6)
+    6
+    """
+    i, max_score, res = 1, 0, 1
+    while i <= 10:
+        score = expected_turn_score(i, sides)
+        if score > max_score:
+            max_score = score
+            res = i
+        i += 1
+    return res
+
+
+def landing_scores(limit):
+    """Return a list whose Kth element is the score a player ends the turn with
+    after reaching K points, i.e. K plus any Pigs on Prime bonus.
+
+    >>> landing_scores(8)
+    [0, 1, 3, 5, 4, 7, 6, 11]
+    """
+    return [k + pigs_on_prime(k, 0) for k in range(limit)]
+
+
+def turn_outcomes(num_rolls, player_score, opponent_score, dists):
+    """Return a list of (points, probability) pairs for a turn rolling NUM_ROLLS
+    dice, where DISTS[n] lists the (points, probability) pairs of roll_dice(n).
+    """
+    if num_rolls == 0:
+        return [(oink_points(player_score, opponent_score), 1.0)]
+    return dists[num_rolls]
+
+
+def make_win_probability(strategy0, strategy1, goal=GOAL_SCORE, sides=6):
+    """Return a function of the two starting scores that gives the exact chance
+    that Player 0 wins play(STRATEGY0, STRATEGY1, score0, score1, dice, GOAL),
+    where dice is a fair SIDES-sided dice and Player 0 moves first.
+
+    Every (score0, score1) state is solved once, working backwards from the
+    states closest to GOAL, so each query is a single table lookup.
+
+    >>> roll_one = lambda score, opponent_score: 1
+    >>> win = make_win_probability(roll_one, roll_one, goal=2, sides=1)
+    >>> win(0, 0)  # Player 0 rolls a 1 and Pigs on Prime finishes the game
+    1.0
+    >>> chance = make_win_probability(roll_one, roll_one, goal=10, sides=6)
+    >>> 0.5 < chance(0, 0) < 1
+    True
+    """
+    win0 = _solved_win_probability(strategy0, strategy1, goal, sides)
+
+    def win_probability(score0=0, score1=0):
+        return win0[score0 * goal + score1]
+    return win_probability
+
+
+@lru_cache(maxsize=16)
+def _solved_win_probability(strategy0, strategy1, goal, sides):
+    """Return solve_win_probability(STRATEGY0, STRATEGY1, GOAL, SIDES), keeping
+    only the most recently used tables.
+    """
+    return solve_win_probability(strategy0, strategy1, goal, sides)
+
+
+def solve_win_probability(strategy0, strategy1, goal=GOAL_SCORE, sides=6):
+    """Return a flat list WIN0 where WIN0[score0 * GOAL + score1] is the chance
+    that Player 0 wins when it is Player 0's turn at (score0, score1).
+    """
+    dists = [None] + [turn_distribution(n, sides) for n in range(1, 11)]
+    landing = landing_scores(turn_score_limit(goal, sides))
+    win0 = [0.0] * (goal * goal)  # Player 0 to move, indexed score0, score1
+    win1 = [0.0] * (goal * goal)  # Player 1 to move, indexed score1, score0
+    # Every turn scores at least one point, so a state only depends on states
+    # with a larger total score.
+    for total in range(2 * goal - 2, -1, -1):
+        for score0 in range(max(0, total - goal + 1), min(total, goal - 1) + 1):
+            score1 = total - score0
+            win0[score0 * goal + score1] = chance_after_turn(
+                strategy0(score0, score1), score0, score1, win1, dists, landing, goal)
+            win1[score1 * goal + score0] = chance_after_turn(
+                strategy1(score1, score0), score1, score0, win0, dists, landing, goal)
+    return win0
+
+
+def chance_after_turn(num_rolls, score, opponent_score, opponent_win, dists,
+                      landing, goal):
+    """Return the chance that the current player wins from (SCORE,
+    OPPONENT_SCORE) by rolling NUM_ROLLS dice, where
+    OPPONENT_WIN[opponent_score * GOAL + score] is the chance that the opponent
+    wins when it is their turn, DISTS is as in turn_outcomes and LANDING is
+    from landing_scores.
+    """
+    chance = 0.0
+    for points, p in turn_outcomes(num_rolls, score, opponent_score, dists):
+        new_score = landing[score + points]
+        if new_score >= goal:
+            chance += p
+        else:
+            chance += p * (1 - opponent_win[opponent_score * goal + new_score])
+    return chance
+
+
+def roll_six(score, opponent_score):
+    """The baseline strategy of the win rate functions: always roll 6 dice."""
+    return 6
+
+
+def exact_win_rate(strategy, baseline=roll_six, goal=GOAL_SCORE, sides=6):
+    """Return the exact proportion of games STRATEGY wins against BASELINE,
+    averaged over going first and going second, like average_win_rate.
+
+    >>> round(exact_win_rate(roll_six), 10)
+    0.5
+    """
+    win_rate_as_player_0 = make_win_probability(strategy, baseline, goal, sides)()
+    win_rate_as_player_1 = 1 - make_win_probability(baseline, strategy, goal, sides)()
+    return (win_rate_as_player_0 + win_rate_as_player_1) / 2
+
+
 def oink_points_strategy(score, opponent_score, threshold=8, num_rolls=6):
     """This strategy returns 0 dice if that gives at least THRESHOLD points, and
     returns NUM_ROLLS otherwise.
@@ -253,16 +759,386 @@ def pigs_on_prime_strategy(score, opponent_score, threshold=8, num_rolls=6):
     effect. It also returns 0 dice if it gives at least THRESHOLD points.
     Otherwise, it returns NUM_ROLLS.
     """
-    if oink_points(score, opponent_score) >= threshold or pigs_on_prime(score+oink_points(score, opponent_score), opponent_score) > 0:
+    points = oink_points(score, opponent_score)
+    if points >= threshold or is_prime(score + points):
         return 0
-    elif pigs_on_prime(score+oink_points(score, opponent_score), opponent_score) == 0:
-        return num_rolls
     else:
         return num_rolls
 
 
+def play_batch(strategy0, strategy1, num_games, goal=GOAL_SCORE, sides=6,
+               seed=None):
+    """Simulate NUM_GAMES independent games of play(STRATEGY0, STRATEGY1) with
+    fair SIDES-sided dice, advancing all unfinished games one turn at a time
+    with NumPy arrays. Return two arrays: the final scores of Player 0 and of
+    Player 1 in each game.
+
+    >>> score0, score1 = play_batch(lambda s, o: 0, lambda s, o: 0, 3, goal=5, seed=1)
+    >>> score0.tolist(), score1.tolist()  # Oink Points: 1, 2 -> 3, 4, 5 -> 7
+    ([7, 7, 7], [4, 4, 4])
+    """
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    tables = [np.frombuffer(compile_strategy(strategy0, goal).table, dtype=np.uint8),
+              np.frombuffer(compile_strategy(strategy1, goal).table, dtype=np.uint8)]
+    landing = np.array(landing_scores(turn_score_limit(goal, sides)))
+    scores = np.zeros((2, num_games), dtype=np.int64)
+    playing = np.arange(num_games)  # Indices of the games that are not over
+    who = 0
+    while playing.size:
+        score = scores[who, playing]
+        opponent_score = scores[1 - who, playing]
+        num_rolls = tables[who][score * goal + opponent_score]
+        points = np.maximum(2 * (opponent_score // 10 % 10) - opponent_score % 10, 1)
+        most_rolls = num_rolls.max()
+        if most_rolls:
+            outcomes = rng.integers(1, sides + 1, size=(playing.size, most_rolls))
+            outcomes[np.arange(most_rolls) >= num_rolls[:, None]] = 0
+            rolled = np.where((outcomes == 1).any(axis=1), 1, outcomes.sum(axis=1))
+            points = np.where(num_rolls == 0, points, rolled)
+        score = landing[score + points]
+        scores[who, playing] = score
+        playing = playing[score < goal]
+        who = 1 - who
+    return scores[0], scores[1]
+
+
+def batch_win_rate(strategy, baseline=roll_six, num_games=100000,
+                   goal=GOAL_SCORE, sides=6, seed=None):
+    """Return the proportion of NUM_GAMES simulated games STRATEGY wins against
+    BASELINE, playing half of them first and half of them second.
+    """
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    strategy = compile_strategy(strategy, goal)
+    baseline = compile_strategy(baseline, goal)
+    half = num_games // 2
+    score0, score1 = play_batch(strategy, baseline, half, goal, sides, rng)
+    wins = int((score0 > score1).sum())
+    score0, score1 = play_batch(baseline, strategy, num_games - half, goal, sides, rng)
+    wins += int((score1 > score0).sum())
+    return wins / num_games
+
+
+def compile_strategy(strategy, goal=GOAL_SCORE):
+    """Return a strategy that gives the same number of dice as STRATEGY in
+    every state of a game to GOAL, evaluating STRATEGY once per state. The
+    result has a table attribute holding one byte per state, indexed by
+    score * GOAL + opponent_score, that simulators can use directly. A
+    compiled strategy is recompiled for a different GOAL from the original
+    STRATEGY, which a bare table cannot be.
+
+    >>> compiled = compile_strategy(oink_points_strategy)
+    >>> compiled(0, 73), compiled(0, 79), len(compiled.table)
+    (0, 6, 10000)
+    >>> compile_strategy(compiled) is compiled
+    True
+    >>> len(compile_strategy(compiled, goal=120).table)
+    14400
+    >>> compile_strategy(table_strategy(compiled.table), goal=120)
+    Traceback (most recent call last):
+        ...
+    AssertionError: Cannot recompile a table for a game to 100 for a game to 120.
+    >>> compile_strategy(lambda score, opponent_score: 11)
+    Traceback (most recent call last):
+        ...
+    AssertionError: Cannot roll more than 10 dice.
+    """
+    if getattr(strategy, 'table', None) is not None:
+        if strategy.goal == goal:
+            return strategy
+        assert getattr(strategy, 'original', None) is not None, \
+            'Cannot recompile a table for a game to {} for a game to {}.'.format(
+                strategy.goal, goal)
+        strategy = strategy.original
+    table = bytearray(goal * goal)
+    for score in range(goal):
+        for opponent_score in range(goal):
+            num_rolls = strategy(score, opponent_score)
+            assert type(num_rolls) == int, 'num_rolls must be an integer.'
+            assert num_rolls >= 0, 'Cannot roll a negative number of dice.'
+            assert num_rolls <= 10, 'Cannot roll more than 10 dice.'
+            table[score * goal + opponent_score] = num_rolls
+    compiled = table_strategy(bytes(table), goal)
+    compiled.original = strategy
+    return compiled
+
+
+def strategy_diff(strategy0, strategy1, goal=GOAL_SCORE):
+    """Return a list of (score, opponent_score, dice0, dice1) for every state
+    in which STRATEGY0 rolls dice0 dice but STRATEGY1 rolls dice1 != dice0.
+
+    >>> strategy_diff(oink_points_strategy, pigs_on_prime_strategy, goal=3)
+    [(1, 0, 6, 0), (1, 1, 6, 0), (1, 2, 6, 0), (2, 0, 6, 0), (2, 1, 6, 0), (2, 2, 6, 0)]
+    """
+    table0 = compile_strategy(strategy0, goal).table
+    table1 = compile_strategy(strategy1, goal).table
+    return [(i // goal, i % goal, table0[i], table1[i])
+            for i in range(goal * goal) if table0[i] != table1[i]]
+
+
+def strategy_family(strategy, **params):
+    """Return a roster of (name, strategy) pairs, one for each combination of
+    the keyword argument values listed in PARAMS.
+
+    >>> roster = strategy_family(oink_points_strategy, threshold=[6, 8], num_rolls=[5])
+    >>> [name for name, _ in roster]
+    ['oink_points_strategy(threshold=6, num_rolls=5)', 'oink_points_strategy(threshold=8, num_rolls=5)']
+    >>> roster[1][1](0, 73)  # Oink Points would score 11 >= 8
+    0
+    """
+    keys = list(params)
+    roster = []
+    for values in itertools.product(*(params[k] for k in keys)):
+        kwargs = dict(zip(keys, values))
+        args = ', '.join('{}={}'.format(k, v) for k, v in kwargs.items())
+        roster.append(('{}({})'.format(strategy.__name__, args),
+                       partial(strategy, **kwargs)))
+    return roster
+
+
+def run_tournament(roster, games_per_pairing=10000, processes=None, seed=0,
+                   checkpoint=None, goal=GOAL_SCORE, chunk_size=1000):
+    """Play every pair of strategies in ROSTER, a list of (name, strategy)
+    pairs, against each other in a process pool of PROCESSES processes. Return
+    a matrix where matrix[i][j] is the proportion of games strategy i won
+    against strategy j, half of them going first and half going second.
+
+    The games of each pairing are split into chunks of CHUNK_SIZE games, so
+    that even a small roster keeps every process busy. Each chunk is seeded
+    from SEED, the two names and its index, so the results do not depend on
+    how many processes there are or in which order they finish. If CHECKPOINT
+    is a path, finished chunks are saved there as they complete, and a
+    tournament that was interrupted resumes from them. With PROCESSES equal to
+    1 the games are played in this process.
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'tournament.json')
+    >>> roster = [('six', roll_six), ('four', lambda score, opponent_score: 4)]
+    >>> run_tournament(roster, 10, processes=1, checkpoint=path, goal=1, chunk_size=4)
+    [[0.5, 0.5], [0.5, 0.5]]
+    >>> with open(path) as f:
+    ...     json.load(f)['wins']  # Whoever goes first wins a game to 1
+    [[0, 1, 0, 2], [0, 1, 1, 2], [0, 1, 2, 1]]
+    >>> run_tournament(roster, 10, processes=1, checkpoint=path, goal=1, chunk_size=4)
+    [[0.5, 0.5], [0.5, 0.5]]
+    """
+    names = [name for name, _ in roster]
+    tables = [compile_strategy(strategy, goal).table for _, strategy in roster]
+    wins = {}  # (i, j, chunk) -> games strategy i won against strategy j
+    settings = [names, seed, games_per_pairing, goal, chunk_size]
+    if checkpoint and os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            saved = json.load(f)
+        assert [saved.get(k) for k in CHECKPOINT_SETTINGS] == settings, \
+            'Checkpoint {} is for a different tournament'.format(checkpoint)
+        for i, j, chunk, won in saved['wins']:
+            wins[(i, j, chunk)] = won
+
+    tasks = [(i, j, chunk, tables[i], tables[j], start,
+              min(chunk_size, games_per_pairing - start),
+              '{}:{}:{}:{}'.format(seed, names[i], names[j], chunk), goal)
+             for i in range(len(roster)) for j in range(i + 1, len(roster))
+             for chunk, start in enumerate(range(0, games_per_pairing, chunk_size))
+             if (i, j, chunk) not in wins]
+    if tasks:
+        if processes == 1:
+            _record_chunks(map(_play_chunk, tasks), wins, checkpoint, settings)
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                _record_chunks(pool.imap_unordered(_play_chunk, tasks), wins,
+                               checkpoint, settings)
+
+    matrix = [[0.5] * len(roster) for _ in roster]
+    totals = {}
+    for (i, j, _), won in wins.items():
+        totals[(i, j)] = totals.get((i, j), 0) + won
+    for (i, j), won in totals.items():
+        matrix[i][j] = won / games_per_pairing
+        matrix[j][i] = 1 - matrix[i][j]
+    return matrix
+
+
+def _play_chunk(task):
+    """Return (i, j, chunk, wins of strategy i) for one chunk of a pairing of
+    run_tournament. Strategy i goes first in the even-numbered games.
+    """
+    i, j, chunk, table_i, table_j, start, num_games, seed, goal = task
+    dice = make_buffered_dice(6, seed)
+    strategy_i, strategy_j = table_strategy(table_i, goal), table_strategy(table_j, goal)
+    quiet = lambda score0, score1, leader=None: (leader, None)
+    won = 0
+    for game in range(start, start + num_games):
+        if game % 2 == 0:
+            score_i, score_j = play(strategy_i, strategy_j, dice=dice, goal=goal, say=quiet)
+        else:
+            score_j, score_i = play(strategy_j, strategy_i, dice=dice, goal=goal, say=quiet)
+        if score_i > score_j:
+            won += 1
+    return i, j, chunk, won
+
+
+CHECKPOINT_SETTINGS = ['names', 'seed', 'games_per_pairing', 'goal', 'chunk_size']
+
+
+def _record_chunks(results, wins, checkpoint, settings):
+    """Add the RESULTS of _play_chunk to WINS, saving each to CHECKPOINT."""
+    for i, j, chunk, won in results:
+        wins[(i, j, chunk)] = won
+        if checkpoint:
+            _save_checkpoint(checkpoint, settings, wins)
+
+
+def _save_checkpoint(path, settings, wins):
+    """Atomically write the finished chunks of a tournament to PATH."""
+    saved = dict(zip(CHECKPOINT_SETTINGS, settings))
+    saved['wins'] = [[i, j, chunk, won] for (i, j, chunk), won in sorted(wins.items())]
+    with open(path + '.tmp', 'w') as f:
+        json.dump(saved, f)
+    os.replace(path + '.tmp', path)
+
+
+def solve_optimal_strategy(goal=GOAL_SCORE, sides=6):
+    """Return a bytes object TABLE where TABLE[score * GOAL + opponent_score] is
+    the number of dice that maximizes the current player's chance of winning,
+    assuming the opponent also plays optimally with fair SIDES-sided dice.
+
+    >>> table = solve_optimal_strategy(goal=10, sides=6)
+    >>> len(table)
+    100
+    >>> all(0 <= n <= 10 for n in table)
+    True
+    """
+    dists = [None] + [turn_distribution(n, sides) for n in range(1, 11)]
+    landing = landing_scores(turn_score_limit(goal, sides))
+    win = [0.0] * (goal * goal)  # Current player to move, indexed score, opponent_score
+    table = bytearray(goal * goal)
+    for total in range(2 * goal - 2, -1, -1):
+        for score in range(max(0, total - goal + 1), min(total, goal - 1) + 1):
+            opponent_score = total - score
+            best_chance, best_num_rolls = -1.0, 0
+            for num_rolls in range(11):
+                chance = chance_after_turn(num_rolls, score, opponent_score, win,
+                                           dists, landing, goal)
+                if chance > best_chance:
+                    best_chance, best_num_rolls = chance, num_rolls
+            win[score * goal + opponent_score] = best_chance
+            table[score * goal + opponent_score] = best_num_rolls
+    return bytes(table)
+
+
+TABLE_HEADER = struct.Struct('>HH')  # goal, sides
+
+
+def save_strategy_table(path, table, goal=GOAL_SCORE, sides=6):
+    """Write TABLE to PATH as a header followed by one byte per state."""
+    assert len(table) == goal * goal, 'The table should have one entry per state.'
+    with open(path, 'wb') as f:
+        f.write(TABLE_HEADER.pack(goal, sides))
+        f.write(table)
+
+
+def load_strategy_table(path):
+    """Return (table, goal, sides) for a table written by save_strategy_table."""
+    with open(path, 'rb') as f:
+        goal, sides = TABLE_HEADER.unpack(f.read(TABLE_HEADER.size))
+        table = f.read()
+    assert len(table) == goal * goal, 'Truncated strategy table: ' + path
+    return table, goal, sides
+
+
+def table_strategy(table, goal=GOAL_SCORE):
+    """Return a strategy that looks up the number of dice to roll in TABLE, as
+    produced by compile_strategy or solve_optimal_strategy.
+    """
+    def strategy(score, opponent_score):
+        return table[score * goal + opponent_score]
+    strategy.table, strategy.goal = table, goal
+    return strategy
+
+
+FINAL_STRATEGY_TABLE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                    'final_strategy.bin')
+_final_strategy_table = None
+
+
+def final_strategy_table():
+    """Return the optimal strategy table for the standard game, loading it from
+    FINAL_STRATEGY_TABLE if it has been written, and solving it otherwise.
+    """
+    global _final_strategy_table
+    if _final_strategy_table is None:
+        if os.path.exists(FINAL_STRATEGY_TABLE):
+            table, goal, sides = load_strategy_table(FINAL_STRATEGY_TABLE)
+            if goal == GOAL_SCORE and sides == 6:
+                _final_strategy_table = table
+        if _final_strategy_table is None:
+            _final_strategy_table = solve_optimal_strategy(GOAL_SCORE, 6)
+    return _final_strategy_table
+
+
 def final_strategy(score, opponent_score):
-    return 6
+    """Return the number of dice that maximizes the chance of winning from
+    (SCORE, OPPONENT_SCORE), as precomputed by solve_optimal_strategy.
+    """
+    return final_strategy_table()[score * GOAL_SCORE + opponent_score]
+
+
+def run_benchmarks():
+    """Time the exact solvers and table lookups."""
+    start = time.perf_counter()
+    table = solve_optimal_strategy(GOAL_SCORE, 6)
+    elapsed = time.perf_counter() - start
+    print('Optimal strategy table built in {:.2f}s ({} bytes)'.format(
+        elapsed, len(table)))
+
+    final_strategy_table()
+    start = time.perf_counter()
+    for score in range(GOAL_SCORE):
+        for opponent_score in range(GOAL_SCORE):
+            final_strategy(score, opponent_score)
+    elapsed = time.perf_counter() - start
+    print('final_strategy lookups: {:.3f}us per state'.format(
+        elapsed / GOAL_SCORE ** 2 * 1e6))
+
+    def trial_division_pigs_on_prime(score):
+        if _is_prime_by_trial_division(score):
+            additional = 1
+            while not _is_prime_by_trial_division(score + additional):
+                additional += 1
+            return additional
+        return 0
+    for name, pigs in [('trial division', trial_division_pigs_on_prime),
+                       ('prime tables', lambda score: pigs_on_prime(score, 0))]:
+        start = time.perf_counter()
+        for _ in range(100):
+            for score in range(GOAL_SCORE + 60):
+                pigs(score)
+        elapsed = time.perf_counter() - start
+        print('Pigs on Prime with {}: {:.3f}us per turn'.format(
+            name, elapsed / (100 * (GOAL_SCORE + 60)) * 1e6))
+
+    for name, turn in [('roll_dice', lambda: roll_dice(10)),
+                       ('sample_turn', lambda: sample_turn(10))]:
+        start = time.perf_counter()
+        for _ in range(100000):
+            turn()
+        elapsed = time.perf_counter() - start
+        print('{} with 10 dice: {:.3f}us per turn'.format(name, elapsed / 100000 * 1e6))
+
+    start = time.perf_counter()
+    max_scoring_num_rolls(total_samples=10000)
+    elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    num_rolls, mean, error = adaptive_max_scoring_num_rolls(max_samples=10000)
+    adaptive_elapsed = time.perf_counter() - start
+    print('max_scoring_num_rolls: {:.2f}s fixed, {:.2f}s adaptive ({} dice, {:.2f} +/- {:.2f})'.format(
+        elapsed, adaptive_elapsed, num_rolls, mean, error))
+
+    start = time.perf_counter()
+    play_batch(roll_six, lambda score, opponent_score: 4, 1000000)
+    elapsed = time.perf_counter() - start
+    print('play_batch: 1000000 games in {:.2f}s'.format(elapsed))
 
 
 @main
@@ -272,7 +1148,15 @@ def run(*args):
     parser = argparse.ArgumentParser(description="Play Hog")
     parser.add_argument('--run_experiments', '-r', action='store_true',
                         help='Runs strategy experiments')
+    parser.add_argument('--benchmark', '-b', action='store_true',
+                        help='Times the exact solvers and simulators')
+    parser.add_argument('--write_final_strategy', '-w', action='store_true',
+                        help='Writes the optimal strategy table for final_strategy')
     args = parser.parse_args()
 
     if args.run_experiments:
         run_experiments()
+    if args.benchmark:
+        run_benchmarks()
+    if args.write_final_strategy:
+        save_strategy_table(FINAL_STRATEGY_TABLE, solve_optimal_strategy(GOAL_SCORE, 6))